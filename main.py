@@ -9,21 +9,38 @@ License: MIT
 """
 
 import requests
+from requests.adapters import HTTPAdapter, Retry
 import subprocess
 import json
 import sys
 import os
 import time
 import re
+import shlex
 import getpass
+import selectors
 import threading
 import logging
+import logging.handlers
+import queue
+import atexit
 import argparse
 import platform
+from collections import deque
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple, Any
 from datetime import datetime
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:
+    orjson = None  # optional speedup; stdlib json is used when absent
+
+# Decoder for hot loops (one call per streamed chunk); orjson raises
+# a ValueError subclass on bad input, same as stdlib json
+_json_loads = json.loads if orjson is None else orjson.loads
+
 # Color codes for terminal output
 class Colors:
     HEADER = '\033[95m'
@@ -36,6 +53,16 @@ class Colors:
     BOLD = '\033[1m'
     UNDERLINE = '\033[4m'
 
+# Strip ANSI codes when stdout isn't a terminal (redirect to file/pipe)
+if not sys.stdout.isatty():
+    for _name in list(vars(Colors)):
+        if not _name.startswith('_'):
+            setattr(Colors, _name, '')
+
+# Styled prefixes used on every turn, formatted once
+_ASSISTANT_PREFIX = f"{Colors.OKCYAN}Assistant:{Colors.ENDC}"
+_EXECUTING_PREFIX = f"{Colors.OKCYAN}Executing:{Colors.ENDC}"
+
 class Config:
     """Configuration management for the IT Assistant."""
     
@@ -48,31 +75,46 @@ class Config:
         self.max_retries = 3
         self.conversation_history_limit = 50
         self.ollama_timeout = 180  # 3 minutes for AI responses
+        # Abort generation as soon as a complete fenced command block has
+        # streamed, skipping the explanatory tail (opt-in)
+        self.stop_after_command = False
         
         # Security settings
         self.require_confirmation = True
         self.sandbox_mode = False
         self.dangerous_commands = [
-            r'rm\s+-rf\s+/',
+            r'\brm\s+-rf\s+/',
             r'format\s+c:',
             r'del\s+/s\s+/q\s+c:\\',
             r'shutdown\s+-h\s+now',
             r'init\s+0',
-            r':(){ :|:& };:',  # Fork bomb
+            r':\(\)\s*\{\s*:\|:&\s*\}\s*;\s*:',  # Fork bomb
             r'dd\s+if=/dev/zero',
             r'mkfs\.',
             r'fdisk.*--delete',
         ]
-        
+
+        # Fused into a single alternation so one regex pass classifies the
+        # command instead of nine separate engine invocations
+        self._dangerous_union = re.compile(
+            '|'.join(f'(?:{p})' for p in self.dangerous_commands), re.IGNORECASE
+        )
+
         self.privileged_commands = [
             'sudo', 'su', 'doas', 'runas',
             'systemctl', 'service', 'chkconfig',
-            'apt', 'yum', 'dnf', 'pacman', 'zypper',
+            'apt', 'apt-get', 'apt-cache', 'apt-key', 'apt-mark',
+            'add-apt-repository', 'dpkg',
+            'yum', 'yum-config-manager', 'dnf', 'rpm',
+            'pacman', 'zypper',
             'mount', 'umount', 'fsck',
             'iptables', 'ufw', 'firewall-cmd',
             'choco', 'brew',
         ]
 
+        # Frozen for O(1) membership tests against command tokens
+        self.privileged_set = frozenset(self.privileged_commands)
+
 class OllamaClient:
     """Handle communication with the Ollama API using chat endpoint."""
     
@@ -81,36 +123,96 @@ class OllamaClient:
         self.base_url = config.ollama_url
         self.model = config.default_model
         self.logger = logging.getLogger(__name__)
-        
-    def test_connection(self) -> bool:
-        """Test if Ollama server is accessible."""
+
+        # One keep-alive session for all Ollama traffic; retries with
+        # backoff cover transient connection failures
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            max_retries=Retry(total=config.max_retries, backoff_factor=0.3)
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def warmup(self):
+        """Pre-load the model so the first turn doesn't pay the cold start.
+
+        An empty /api/generate prompt makes Ollama map the weights into
+        memory without generating anything. Best effort — on failure the
+        first chat simply loads the model itself.
+        """
+        try:
+            self.session.post(
+                f"{self.base_url}/api/generate",
+                json={"model": self.model, "prompt": "", "keep_alive": "30m", "stream": False},
+                timeout=self.config.ollama_timeout
+            )
+        except requests.exceptions.RequestException:
+            pass
+
+    def release_model(self):
+        """Ask Ollama to unload the model promptly instead of holding VRAM.
+
+        Counterpart of the keep_alive sent with each chat request; best
+        effort, since the server unloads idle models on its own eventually.
+        """
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
-            return response.status_code == 200
+            self.session.post(
+                f"{self.base_url}/api/generate",
+                json={"model": self.model, "keep_alive": 0},
+                timeout=5
+            )
+        except requests.exceptions.RequestException:
+            pass
+
+    def close(self):
+        """Release the pooled HTTP connections."""
+        self.session.close()
+
+    def probe(self) -> Tuple[bool, List[str]]:
+        """Check server reachability and fetch models in one round trip."""
+        try:
+            response = self.session.get(f"{self.base_url}/api/tags", timeout=5)
+            if response.status_code != 200:
+                return False, []
+            # Ollama always returns UTF-8 JSON; decoding from the raw
+            # bytes skips response.json()'s encoding detection
+            data = _json_loads(response.content)
+            return True, [model['name'] for model in data.get('models', [])]
         except requests.exceptions.RequestException as e:
             self.logger.error(f"Failed to connect to Ollama: {e}")
-            return False
-    
+            return False, []
+
+    def test_connection(self) -> bool:
+        """Test if Ollama server is accessible."""
+        return self.probe()[0]
+
     def list_models(self) -> List[str]:
         """Get list of available models."""
-        try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                return [model['name'] for model in data.get('models', [])]
-        except requests.exceptions.RequestException as e:
-            self.logger.error(f"Failed to get model list: {e}")
-        return []
+        return self.probe()[1]
     
-    def chat(self, messages: List[Dict], timeout: int = None) -> Optional[str]:
-        """Send chat request to Ollama API."""
+    def chat(self, messages: List[Dict], timeout: int = None, echo: bool = False,
+             stop_on_fence: bool = False) -> Optional[str]:
+        """Send chat request to Ollama API, streaming the response.
+
+        With echo=True, tokens are printed to stdout as they arrive so
+        the user sees output at first-token latency instead of waiting
+        for the whole generation. With stop_on_fence=True, the request is
+        closed as soon as a complete ``` block has streamed — Ollama stops
+        generating when the client disconnects, saving whatever
+        explanatory tail would have followed the command.
+        """
         timeout = timeout or self.config.ollama_timeout
-        
+
         try:
             payload = {
                 "model": self.model,
                 "messages": messages,
-                "stream": False,
+                "stream": True,
+                # Keep the model resident between turns so a pause in the
+                # conversation doesn't force a full reload from disk
+                "keep_alive": "30m",
                 "options": {
                     "temperature": 0.7,
                     "top_p": 0.9,
@@ -118,31 +220,90 @@ class OllamaClient:
                     "num_predict": 512,
                 }
             }
-            
-            print(f"{Colors.WARNING}Requesting from: {self.base_url}/api/chat{Colors.ENDC}")
-            print(f"{Colors.WARNING}Model: {self.model} | Timeout: {timeout}s{Colors.ENDC}")
-            
-            response = requests.post(
-                f"{self.base_url}/api/chat",
-                json=payload,
-                timeout=timeout
+
+            self.logger.debug(
+                f"Requesting {self.base_url}/api/chat | model={self.model} | timeout={timeout}s"
             )
-            
-            if response.status_code == 200:
-                data = response.json()
-                return data.get('message', {}).get('content', '').strip()
+
+            if orjson is not None:
+                body = {"data": orjson.dumps(payload), "headers": {"Content-Type": "application/json"}}
             else:
-                self.logger.error(f"Ollama API error: {response.status_code} - {response.text}")
-                return None
-                
+                body = {"json": payload}
+
+            # Stream the response so a slow generation never sits buffered
+            # server-side; the timeout applies per chunk, not to the whole
+            # generation.
+            response = self.session.post(
+                f"{self.base_url}/api/chat",
+                stream=True,
+                timeout=(5, timeout),
+                **body
+            )
+
+            # Fail fast on HTTP errors — no point decoding an error body
+            response.raise_for_status()
+
+            return self._accumulate_streaming_response(
+                response, echo=echo, stop_on_fence=stop_on_fence
+            )
+
         except requests.exceptions.Timeout:
             self.logger.error(f"Request timed out after {timeout} seconds")
             print(f"{Colors.FAIL}AI response timed out. Try using a smaller/faster model or increase timeout.{Colors.ENDC}")
             return None
+        except requests.exceptions.HTTPError as e:
+            self.logger.error(f"Ollama API error: {e}")
+            return None
         except requests.exceptions.RequestException as e:
             self.logger.error(f"Request failed: {e}")
             return None
 
+    def _accumulate_streaming_response(self, response, echo: bool = False,
+                                       stop_on_fence: bool = False) -> Optional[str]:
+        """Collect streamed chat chunks into the final response string."""
+        buf = []
+        fence_count = 0
+        tail = ''
+        try:
+            # Bytes mode: chunks go to the JSON decoder without an extra
+            # per-line transcode pass (both decoders accept bytes)
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                try:
+                    obj = _json_loads(line)
+                except ValueError as e:
+                    self.logger.error(f"Malformed streaming chunk: {e}")
+                    continue
+                fragment = obj.get('message', {}).get('content', '')
+                if fragment:
+                    buf.append(fragment)
+                    if echo:
+                        sys.stdout.write(fragment)
+                        sys.stdout.flush()
+                    if stop_on_fence:
+                        # Count ``` markers incrementally, carrying a short
+                        # tail so markers split across chunks still match;
+                        # the second marker closes the first block
+                        pending = tail + fragment
+                        idx = 0
+                        while (j := pending.find('```', idx)) != -1:
+                            fence_count += 1
+                            idx = j + 3
+                        tail = pending[max(idx, len(pending) - 2):]
+                        if fence_count >= 2:
+                            # Trim anything after the closing fence, then
+                            # close the response to abort generation
+                            keep = idx - len(pending) + len(fragment)
+                            if 0 <= keep < len(fragment):
+                                buf[-1] = fragment[:keep]
+                            break
+                if obj.get('done'):
+                    break
+        finally:
+            response.close()
+        return ''.join(buf).strip()
+
 class SecurityValidator:
     """Validate command safety and security."""
     
@@ -152,15 +313,17 @@ class SecurityValidator:
     
     def is_dangerous_command(self, command: str) -> Tuple[bool, str]:
         """Check if command is potentially dangerous."""
-        for pattern in self.config.dangerous_commands:
-            if re.search(pattern, command, re.IGNORECASE):
-                return True, f"Command matches dangerous pattern: {pattern}"
+        match = self.config._dangerous_union.search(command)
+        if match:
+            return True, f"Command matches dangerous pattern: {match.group(0)!r}"
         return False, ""
     
     def requires_privileges(self, command: str) -> bool:
         """Check if command requires elevated privileges."""
-        command_lower = command.lower().strip()
-        return any(cmd in command_lower for cmd in self.config.privileged_commands)
+        # Token membership rather than substring scan, so e.g. "sudoku"
+        # no longer false-matches "sudo"
+        tokens = command.lower().split()
+        return not self.config.privileged_set.isdisjoint(tokens)
     
     def validate_command(self, command: str) -> Tuple[bool, str, bool]:
         """
@@ -228,7 +391,10 @@ class PermissionManager:
 
 class CommandExecutor:
     """Execute system commands safely with proper error handling."""
-    
+
+    # Cap on output retained per stream for the AI follow-up analysis
+    _MAX_CAPTURE = 1 << 20  # 1 MB
+
     def __init__(self, config: Config):
         self.config = config
         self.logger = logging.getLogger(__name__)
@@ -258,69 +424,172 @@ class CommandExecutor:
                 return False, "", "Permission denied by user"
         
         try:
-            print(f"{Colors.OKCYAN}Executing:{Colors.ENDC} {command}")
-            
-            # Execute command with timeout
+            print(f"{_EXECUTING_PREFIX} {command}")
+
+            # Commands without shell features exec directly, skipping the
+            # intermediate /bin/sh process
+            args, use_shell = command, True
+            if not self._needs_shell(command):
+                try:
+                    args, use_shell = shlex.split(command), False
+                except ValueError:
+                    pass  # unbalanced quotes etc. — let the shell sort it out
+
+            # Execute command with timeout, relaying output as it arrives
             process = subprocess.Popen(
-                command,
-                shell=True,
+                args,
+                shell=use_shell,
                 stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                universal_newlines=True
+                stderr=subprocess.PIPE
             )
-            
+
             try:
-                stdout, stderr = process.communicate(timeout=timeout)
+                stdout, stderr = self._stream_process_output(process, timeout)
                 return_code = process.returncode
-                
+
                 if return_code == 0:
                     print(f"{Colors.OKGREEN}✓ Command completed successfully{Colors.ENDC}")
                     return True, stdout, stderr
                 else:
                     print(f"{Colors.FAIL}✗ Command failed with code {return_code}{Colors.ENDC}")
                     return False, stdout, stderr
-                    
+
             except subprocess.TimeoutExpired:
                 process.kill()
                 error_msg = f"Command timed out after {timeout} seconds"
                 self.logger.error(error_msg)
                 return False, "", error_msg
-                
+
         except Exception as e:
             error_msg = f"Execution error: {str(e)}"
             self.logger.error(error_msg)
             return False, "", error_msg
 
+    @staticmethod
+    def _needs_shell(command: str) -> bool:
+        """Whether the command relies on shell features (pipes, redirects, expansion)."""
+        if any(c in command for c in "|&;<>$`*?~{}[]()\n"):
+            return True
+        # A leading NAME=value token is a shell environment assignment,
+        # not an executable (e.g. DEBIAN_FRONTEND=noninteractive apt ...)
+        first = command.split(None, 1)[0] if command.strip() else ''
+        return '=' in first
+
+    def _stream_process_output(self, process: subprocess.Popen, timeout: int) -> Tuple[str, str]:
+        """Relay process output to the terminal as it arrives.
+
+        Long-running commands (apt/yum installs) show progress instead of
+        going silent until completion, and captures are capped at
+        _MAX_CAPTURE bytes per stream so verbose logs can't balloon memory.
+        Returns decoded (stdout, stderr).
+        """
+        if os.name != 'posix':
+            # select() can't watch pipes on Windows; fall back to buffering
+            # and display the captured output here, since callers rely on
+            # this method having shown it
+            stdout, stderr = process.communicate(timeout=timeout)
+            stdout = stdout.decode(errors='replace')
+            stderr = stderr.decode(errors='replace')
+            if stdout:
+                print(f"{Colors.OKGREEN}Output:{Colors.ENDC}\n{stdout}")
+            if stderr:
+                print(f"{Colors.WARNING}Errors:{Colors.ENDC}\n{stderr}")
+            return stdout, stderr
+
+        sel = selectors.DefaultSelector()
+        sel.register(process.stdout, selectors.EVENT_READ, 'stdout')
+        sel.register(process.stderr, selectors.EVENT_READ, 'stderr')
+
+        buffers = {'stdout': [], 'stderr': []}
+        sizes = {'stdout': 0, 'stderr': 0}
+        deadline = time.monotonic() + timeout
+
+        # Forward raw bytes straight to the stdout buffer — no per-chunk
+        # str formatting — and flush every few chunks rather than each one
+        out = sys.stdout.buffer
+        header_shown = False
+        unflushed = 0
+
+        try:
+            while sel.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise subprocess.TimeoutExpired(process.args, timeout)
+
+                for key, _ in sel.select(remaining):
+                    chunk = os.read(key.fileobj.fileno(), 32768)
+                    if not chunk:
+                        sel.unregister(key.fileobj)
+                        continue
+
+                    if not header_shown:
+                        print(f"{Colors.OKGREEN}Output:{Colors.ENDC}")
+                        header_shown = True
+
+                    out.write(chunk)
+                    unflushed += 1
+                    if unflushed >= 8:
+                        out.flush()
+                        unflushed = 0
+
+                    name = key.data
+                    if sizes[name] < self._MAX_CAPTURE:
+                        buffers[name].append(chunk)
+                        sizes[name] += len(chunk)
+        finally:
+            if unflushed:
+                out.flush()
+            sel.close()
+
+        remaining = max(deadline - time.monotonic(), 0)
+        process.wait(timeout=remaining)
+
+        return (
+            b''.join(buffers['stdout']).decode(errors='replace'),
+            b''.join(buffers['stderr']).decode(errors='replace'),
+        )
+
 class ResponseParser:
     """Parse LLM responses to extract executable commands."""
     
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         
-        # Patterns to identify commands in responses
-        self.command_patterns = [
-            r'```bash\n(.*?)\n```',
-            r'```shell\n(.*?)\n```',
-            r'```sh\n(.*?)\n```',
-            r'Command:\s*`([^`]+)`',
-            r'Execute:\s*`([^`]+)`',
-            r'Run:\s*`([^`]+)`',
-            r'```\n(.*?)\n```',
-        ]
-    
     def extract_commands(self, response: str) -> List[str]:
         """Extract executable commands from LLM response."""
+        # Both the fence and inline forms need a backtick somewhere; this
+        # C-level scan skips the regex work entirely for plain-prose
+        # responses (refusals, questions, explanations)
+        if '`' not in response:
+            return []
+
         commands = []
-        
-        for pattern in self.command_patterns:
-            matches = re.findall(pattern, response, re.DOTALL | re.IGNORECASE)
-            for match in matches:
-                # Clean up the command
-                cmd = match.strip()
-                if cmd and not cmd.startswith('#'):  # Skip comments
-                    commands.append(cmd)
-        
+
+        # Walk the fenced blocks with str.find — the delimiters are fixed
+        # literals, so plain C substring scans beat the regex engine here
+        pos = 0
+        while (start := response.find('```', pos)) != -1:
+            lang_end = response.find('\n', start + 3)
+            if lang_end == -1:
+                break
+            lang = response[start + 3:lang_end].strip().lower()
+            end = response.find('```', lang_end + 1)
+            if end == -1:
+                break
+            pos = end + 3
+            if lang not in ('', 'bash', 'sh', 'shell'):
+                continue
+            for line in response[lang_end + 1:end].splitlines():
+                # Clean up the command, skipping comments
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    commands.append(line)
+
+        for match in _INLINE_CMD_RE.finditer(response):
+            cmd = match.group(1).strip()
+            if cmd and not cmd.startswith('#'):
+                commands.append(cmd)
+
         return commands
     
     def needs_user_input(self, response: str) -> bool:
@@ -337,118 +606,113 @@ class ResponseParser:
         
         return any(indicator in response.lower() for indicator in input_indicators)
 
+SYSTEM_PROMPT = """You are an expert IT professional assistant. Your role is to help users with any technical requests while maintaining the highest standards of professionalism, security, and problem-solving expertise.
+
+When providing solutions:
+1. Analyze the request carefully and determine if it's actionable
+2. Ask for specific information if needed
+3. Provide step-by-step solutions with clear explanations
+4. For executable commands, wrap them in ```bash or ```shell code blocks
+5. Explain what each command does and why it's needed
+6. Mention any risks or side effects
+7. Provide verification steps after execution
+
+Always prioritize system stability and security. Be thorough, professional, and educational in your responses."""
+
 class ConversationManager:
     """Manage conversation history and context."""
-    
+
     def __init__(self, config: Config):
         self.config = config
-        self.history = []
+        # Ring buffer: appends are O(1) and old messages fall off the
+        # front automatically once the limit is reached
+        self.history = deque(maxlen=config.conversation_history_limit)
         self.logger = logging.getLogger(__name__)
-    
+        # Chat-formatted messages maintained incrementally so each turn
+        # doesn't rebuild the full list (system prompt included)
+        self._messages_cache = [{"role": "system", "content": SYSTEM_PROMPT}]
+
     def add_message(self, role: str, content: str, metadata: Dict = None):
         """Add message to conversation history."""
+        # Timestamps stay as raw nanosecond counts; formatting to ISO is
+        # deferred to save_history so the per-message cost is one clock read
         message = {
             "role": role,
             "content": content,
-            "timestamp": datetime.now().isoformat(),
+            "ts_ns": time.time_ns(),
             "metadata": metadata or {}
         }
-        
+
+        # The deque drops its oldest entry on append once full; mirror
+        # that in the cache (index 0 is the system prompt)
+        if len(self.history) == self.history.maxlen:
+            del self._messages_cache[1]
+
         self.history.append(message)
-        
-        # Limit history size
-        if len(self.history) > self.config.conversation_history_limit:
-            self.history = self.history[-self.config.conversation_history_limit:]
-    
+        self._messages_cache.append({"role": role, "content": content})
+
     def get_chat_messages(self) -> List[Dict]:
         """Get conversation history formatted for chat endpoint."""
-        messages = [
-            {
-                "role": "system",
-                "content": """You are an expert IT professional assistant. Your role is to help users with any technical requests while maintaining the highest standards of professionalism, security, and problem-solving expertise.
-
-When providing solutions:
-1. Analyze the request carefully and determine if it's actionable
-2. Ask for specific information if needed
-3. Provide step-by-step solutions with clear explanations
-4. For executable commands, wrap them in ```bash or ```shell code blocks
-5. Explain what each command does and why it's needed
-6. Mention any risks or side effects
-7. Provide verification steps after execution
-
-Always prioritize system stability and security. Be thorough, professional, and educational in your responses."""
-            }
-        ]
-        
-        for msg in self.history:
-            messages.append({
-                "role": msg["role"],
-                "content": msg["content"]
-            })
-        
-        return messages
+        return self._messages_cache
     
     def save_history(self, filename: str = None):
-        """Save conversation history to file."""
-        filename = filename or f"conversation_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        
+        """Save conversation history as JSON lines (one message per line)."""
+        filename = filename or f"conversation_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+
         try:
-            with open(filename, 'w') as f:
-                json.dump(self.history, f, indent=2)
+            # Stream one record per line so memory stays bounded no matter
+            # how long the session ran, and saves can later be appended to
+            with open(filename, 'wb', buffering=1 << 16) as f:
+                for msg in self.history:
+                    record = {
+                        "role": msg["role"],
+                        "content": msg["content"],
+                        "timestamp": datetime.fromtimestamp(msg["ts_ns"] / 1e9).isoformat(),
+                        "metadata": msg["metadata"],
+                    }
+                    if orjson is not None:
+                        f.write(orjson.dumps(record))
+                    else:
+                        f.write(json.dumps(record).encode())
+                    f.write(b"\n")
             print(f"Conversation saved to {filename}")
         except Exception as e:
             self.logger.error(f"Failed to save conversation: {e}")
 
-class ITAssistant:
-    """Main IT Assistant class orchestrating all components."""
-    
-    def __init__(self, config: Config):
-        self.config = config
-        self.ollama_client = OllamaClient(config)
-        self.command_executor = CommandExecutor(config)
-        self.response_parser = ResponseParser()
-        self.conversation_manager = ConversationManager(config)
-        self.logger = logging.getLogger(__name__)
-        self.os_type = platform.system().lower()
+    def load_history(self, filename: str):
+        """Load conversation history from a JSON-lines file."""
+        try:
+            with open(filename, 'rb') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    record = _json_loads(line)
+                    self.add_message(record["role"], record["content"], record.get("metadata"))
+                    if "timestamp" in record:
+                        self.history[-1]["ts_ns"] = int(
+                            datetime.fromisoformat(record["timestamp"]).timestamp() * 1e9
+                        )
+        except Exception as e:
+            self.logger.error(f"Failed to load conversation: {e}")
 
-    def initialize(self) -> bool:
-        """Initialize the assistant and check connections."""
-        print(f"{Colors.HEADER}IT Assistant v1.2 - Professional System Administration{Colors.ENDC}")
-        print(f"Platform: {platform.system()} {platform.release()}")
-        
-        # Test Ollama connection
-        print("Testing Ollama connection...", end=" ")
-        if self.ollama_client.test_connection():
-            print(f"{Colors.OKGREEN}✓ Connected{Colors.ENDC}")
-        else:
-            print(f"{Colors.FAIL}✗ Failed{Colors.ENDC}")
-            print("Please ensure Ollama is running and accessible.")
-            return False
-        
-        # List available models
-        models = self.ollama_client.list_models()
-        if models:
-            print(f"Available models: {', '.join(models)}")
-            if self.config.default_model not in models:
-                print(f"{Colors.WARNING}Warning: Default model '{self.config.default_model}' not found{Colors.ENDC}")
-        
-        print(f"Using model: {Colors.BOLD}{self.config.default_model}{Colors.ENDC}")
-        print(f"Type 'help' for commands, 'quit' to exit\n")
-        
-        return True
-    
-    def _generate_fallback_response(self, user_input: str) -> str:
-        """Generate a basic fallback response when AI is unavailable."""
-        user_lower = user_input.lower()
-        
-        # Check for installation requests
-        install_match = re.match(r'\b(?:install|setup)\s+([a-zA-Z0-9\-_]+)\b', user_lower)
-        if install_match:
-            package = install_match.group(1)
-            return self._generate_install_commands(package)
-        
-        if any(word in user_lower for word in ['disk', 'space', 'storage']):
-            return """AI unavailable. Here are basic disk space commands:
+# Special REPL commands that end the session
+_EXIT_COMMANDS = frozenset({'quit', 'exit', 'q'})
+
+# Detects "install <pkg>" / "setup <pkg>" requests (input already lowered)
+_INSTALL_RE = re.compile(r'\b(?:install|setup)\s+([a-zA-Z0-9\-_]+)\b')
+
+# Inline Command:/Execute:/Run: command form, compiled once at import
+# (fenced blocks are scanned with str.find — see extract_commands)
+_INLINE_CMD_RE = re.compile(r'(?:Command|Execute|Run):\s*`([^`]+)`', re.IGNORECASE)
+
+# Single alternation tagging the fallback category in one scan
+FALLBACK_RE = re.compile(
+    r"\b(?:(?P<disk>disk|space|storage)|(?P<proc>process|cpu|memory)|(?P<net>network|connection|port))\b",
+    re.IGNORECASE
+)
+
+FALLBACK_DISK_RESPONSE = """AI unavailable. Here are basic disk space commands:
 
 ```bash
 df -h
@@ -459,9 +723,8 @@ Shows disk usage in human-readable format.
 du -sh /*
 ```
 Shows directory sizes in root."""
-        
-        elif any(word in user_lower for word in ['process', 'cpu', 'memory']):
-            return """AI unavailable. Here are process monitoring commands:
+
+FALLBACK_PROC_RESPONSE = """AI unavailable. Here are process monitoring commands:
 
 ```bash
 top
@@ -472,9 +735,8 @@ Shows running processes and resource usage.
 ps aux | head -20
 ```
 Lists running processes."""
-        
-        elif any(word in user_lower for word in ['network', 'connection', 'port']):
-            return """AI unavailable. Here are network diagnostic commands:
+
+FALLBACK_NET_RESPONSE = """AI unavailable. Here are network diagnostic commands:
 
 ```bash
 netstat -tulpn
@@ -485,172 +747,258 @@ Shows listening ports.
 ping -c 4 8.8.8.8
 ```
 Tests internet connectivity."""
-        
-        else:
-            return f"""AI model is currently unavailable (timeout). 
-
-You asked: "{user_input}"
 
-Please try:
-1. Using a smaller/faster model (llama2 7B instead of 13B/70B)
-2. Restarting Ollama: 'ollama serve'
-3. Checking system resources with 'htop'
-4. Reducing prompt complexity
+_FALLBACK_RESPONSES = {
+    "disk": FALLBACK_DISK_RESPONSE,
+    "proc": FALLBACK_PROC_RESPONSE,
+    "net": FALLBACK_NET_RESPONSE,
+}
 
-Type your request again when ready."""
-    
-    def _generate_install_commands(self, package: str) -> str:
-        """Generate OS-specific commands for installing a package."""
-        if self.os_type == "linux":
-            # Check for common Linux distributions
-            try:
-                with open("/etc/os-release", "r") as f:
-                    os_info = f.read().lower()
-                    if "debian" in os_info or "ubuntu" in os_info:
-                        return f"""To install {package} on Debian/Ubuntu-based systems:
+# Install instructions per distro/OS family, rendered on demand
+_INSTALL_TEMPLATES = {
+    "debian": """To install {pkg} on Debian/Ubuntu-based systems:
 
 ```bash
 sudo apt update
-sudo apt install {package}
+sudo apt install {pkg}
 ```
-These commands update the package lists and install {package}."""
-                    elif "centos" in os_info or "fedora" in os_info or "rhel" in os_info:
-                        return f"""To install {package} on Red Hat-based systems:
+These commands update the package lists and install {pkg}.""",
+    "rhel": """To install {pkg} on Red Hat-based systems:
 
 ```bash
-sudo dnf install {package}
+sudo dnf install {pkg}
 ```
-This command installs {package} using the DNF package manager."""
-                    elif "arch" in os_info:
-                        return f"""To install {package} on Arch Linux:
+This command installs {pkg} using the DNF package manager.""",
+    "arch": """To install {pkg} on Arch Linux:
 
 ```bash
-sudo pacman -S {package}
+sudo pacman -S {pkg}
 ```
-This command installs {package} using the pacman package manager."""
-                    else:
-                        return f"""To install {package} on other Linux distributions:
+This command installs {pkg} using the pacman package manager.""",
+    "linux": """To install {pkg} on other Linux distributions:
 
 ```bash
-sudo yum install {package}
+sudo yum install {pkg}
 ```
-This command attempts to install {package} using the YUM package manager. If this fails, check your distribution's package manager."""
-            except FileNotFoundError:
-                return f"""To install {package} on Linux (generic):
-
-```bash
-sudo yum install {package}
-```
-This command attempts to install {package} using the YUM package manager. If this fails, check your distribution's package manager."""
-        
-        elif self.os_type == "darwin":
-            return f"""To install {package} on macOS, you need Homebrew installed. If you don't have Homebrew, install it first:
+This command attempts to install {pkg} using the YUM package manager. If this fails, check your distribution's package manager.""",
+    "darwin": """To install {pkg} on macOS, you need Homebrew installed. If you don't have Homebrew, install it first:
 
 ```bash
 /bin/bash -c "$(curl -fsSL https://raw.githubusercontent.com/Homebrew/install/HEAD/install.sh)"
 ```
-Then install {package}:
+Then install {pkg}:
 
 ```bash
-brew install {package}
+brew install {pkg}
 ```
-These commands install Homebrew (if needed) and then {package}."""
-        
-        elif self.os_type == "windows":
-            return f"""To install {package} on Windows, you need Chocolatey installed. If you don't have Chocolatey, install it first (requires PowerShell as Administrator):
+These commands install Homebrew (if needed) and then {pkg}.""",
+    "windows": """To install {pkg} on Windows, you need Chocolatey installed. If you don't have Chocolatey, install it first (requires PowerShell as Administrator):
 
 ```powershell
 Set-ExecutionPolicy Bypass -Scope Process -Force; [System.Net.ServicePointManager]::SecurityProtocol = [System.Net.ServicePointManager]::SecurityProtocol -bor 3072; iex ((New-Object System.Net.WebClient).DownloadString('https://community.chocolatey.org/install.ps1'))
 ```
-Then install {package}:
+Then install {pkg}:
 
 ```powershell
-choco install {package}
+choco install {pkg}
 ```
-These commands install Chocolatey (if needed) and then {package}."""
+These commands install Chocolatey (if needed) and then {pkg}.""",
+    "unknown": """Unsupported operating system for installing {pkg}. Please specify the installation method for your system or consult the package documentation.""",
+}
+
+@lru_cache(maxsize=256)
+def _render_install_commands(family: str, package: str) -> str:
+    """Render (and memoize) the install instructions for a package."""
+    return _INSTALL_TEMPLATES.get(family, _INSTALL_TEMPLATES["unknown"]).format(pkg=package)
+
+class ITAssistant:
+    """Main IT Assistant class orchestrating all components."""
+    
+    def __init__(self, config: Config):
+        self.config = config
+        self.ollama_client = OllamaClient(config)
+        self.command_executor = CommandExecutor(config)
+        self.response_parser = ResponseParser()
+        self.conversation_manager = ConversationManager(config)
+        self.logger = logging.getLogger(__name__)
+        self.os_type = platform.system().lower()
+        self.distro_family = self._detect_distro(self.os_type)
+
+    @staticmethod
+    def _detect_distro(os_type: str) -> str:
+        """Classify the host into an install-template family (read once)."""
+        if os_type in ("darwin", "windows"):
+            return os_type
+        if os_type != "linux":
+            return "unknown"
+        try:
+            with open("/etc/os-release", "r") as f:
+                os_info = f.read().lower()
+        except FileNotFoundError:
+            return "linux"
+        if "debian" in os_info or "ubuntu" in os_info:
+            return "debian"
+        elif "centos" in os_info or "fedora" in os_info or "rhel" in os_info:
+            return "rhel"
+        elif "arch" in os_info:
+            return "arch"
+        return "linux"
+
+    def initialize(self) -> bool:
+        """Initialize the assistant and check connections."""
+        print(f"{Colors.HEADER}IT Assistant v1.2 - Professional System Administration{Colors.ENDC}")
+        print(f"Platform: {platform.system()} {platform.release()}")
         
+        # One /api/tags round trip covers both the connectivity check and
+        # the model listing
+        print("Testing Ollama connection...", end=" ")
+        connected, models = self.ollama_client.probe()
+        if connected:
+            print(f"{Colors.OKGREEN}✓ Connected{Colors.ENDC}")
         else:
-            return f"""Unsupported operating system for installing {package}. Please specify the installation method for your system or consult the package documentation."""
+            print(f"{Colors.FAIL}✗ Failed{Colors.ENDC}")
+            print("Please ensure Ollama is running and accessible.")
+            return False
+
+        if models:
+            print(f"Available models: {', '.join(models)}")
+            if self.config.default_model not in models:
+                print(f"{Colors.WARNING}Warning: Default model '{self.config.default_model}' not found{Colors.ENDC}")
+        
+        print(f"Using model: {Colors.BOLD}{self.config.default_model}{Colors.ENDC}")
+        print(f"Type 'help' for commands, 'quit' to exit\n")
+
+        # Warm the model in the background while the user types their
+        # first question, hiding the cold-load latency
+        threading.Thread(target=self.ollama_client.warmup, daemon=True).start()
 
-    def process_user_input(self, user_input: str) -> str:
+        return True
+    
+    def _generate_fallback_response(self, user_input: str, user_lower: str = None) -> str:
+        """Generate a basic fallback response when AI is unavailable."""
+        if user_lower is None:
+            user_lower = user_input.lower()
+
+        # Check for installation requests
+        install_match = _INSTALL_RE.match(user_lower)
+        if install_match:
+            package = install_match.group(1)
+            return self._generate_install_commands(package)
+
+        # One pass over the input tags the category via named groups
+        match = FALLBACK_RE.search(user_input)
+        if match:
+            return _FALLBACK_RESPONSES[match.lastgroup]
+
+        return f"""AI model is currently unavailable (timeout).
+
+You asked: "{user_input}"
+
+Please try:
+1. Using a smaller/faster model (llama2 7B instead of 13B/70B)
+2. Restarting Ollama: 'ollama serve'
+3. Checking system resources with 'htop'
+4. Reducing prompt complexity
+
+Type your request again when ready."""
+    
+    def _generate_install_commands(self, package: str) -> str:
+        """Generate OS-specific commands for installing a package."""
+        return _render_install_commands(self.distro_family, package)
+
+    def process_user_input(self, user_input: str, user_lower: str = None) -> str:
         """Process user input and generate response."""
+        if user_lower is None:
+            user_lower = user_input.lower()
+
         # Add user message to history
         self.conversation_manager.add_message("user", user_input)
-        
+
         # Handle installation requests
-        install_match = re.match(r'\b(?:install|setup)\s+([a-zA-Z0-9\-_]+)\b', user_input.lower())
+        install_match = _INSTALL_RE.match(user_lower)
         if install_match:
             package = install_match.group(1)
             response = self._generate_install_commands(package)
             self.conversation_manager.add_message("assistant", response)
+            print(f"\n{_ASSISTANT_PREFIX}\n{response}")
             return response
-        
+
         # Get chat messages for context
         messages = self.conversation_manager.get_chat_messages()
-        
-        # Generate response from Ollama
-        response = self.ollama_client.chat(messages, timeout=self.config.ollama_timeout)
-        
+
+        # Generate response from Ollama, echoing tokens as they stream in
+        print(f"\n{_ASSISTANT_PREFIX}")
+        response = self.ollama_client.chat(
+            messages,
+            timeout=self.config.ollama_timeout,
+            echo=True,
+            stop_on_fence=self.config.stop_after_command
+        )
+
         if not response:
             # Fallback response if AI is unavailable
-            fallback_response = self._generate_fallback_response(user_input)
+            fallback_response = self._generate_fallback_response(user_input, user_lower)
             self.conversation_manager.add_message("assistant", fallback_response)
+            print(fallback_response)
             return fallback_response
-        
+
+        print()  # finish the streamed line
+
         # Add assistant response to history
         self.conversation_manager.add_message("assistant", response)
-        
+
         return response
     
+    # Bound on failure-analysis rounds so bad fixes can't loop forever
+    MAX_FIX_ROUNDS = 3
+
     def handle_command_execution(self, response: str) -> str:
         """Handle execution of commands found in the response."""
         commands = self.response_parser.extract_commands(response)
-        
-        if not commands:
-            return response
-        
-        execution_results = []
-        
-        for command in commands:
-            print(f"\n{Colors.OKBLUE}Found command to execute:{Colors.ENDC} {command}")
-            
-            # Ask user if they want to execute
-            if input("Execute this command? (y/n): ").lower().strip() == 'y':
-                success, stdout, stderr = self.command_executor.execute_command(command)
-                
-                result = {
-                    "command": command,
-                    "success": success,
-                    "stdout": stdout,
-                    "stderr": stderr
-                }
-                
-                execution_results.append(result)
-                
-                # Show output
-                if stdout:
-                    print(f"{Colors.OKGREEN}Output:{Colors.ENDC}\n{stdout}")
-                if stderr:
-                    print(f"{Colors.WARNING}Errors:{Colors.ENDC}\n{stderr}")
-                
-                # If command failed, ask AI to analyze and fix
-                if not success and stderr:
-                    print(f"\n{Colors.WARNING}Command failed. Asking AI for solution...{Colors.ENDC}")
-                    
-                    self.conversation_manager.add_message(
-                        "user",
-                        f"The command '{command}' failed with this error:\n{stderr}\nPlease analyze this error and provide a solution or alternative approach."
-                    )
-                    
-                    fix_response = self.ollama_client.chat(self.conversation_manager.get_chat_messages())
-                    
-                    if fix_response:
-                        print(f"\n{Colors.OKCYAN}AI Analysis:{Colors.ENDC}\n{fix_response}")
-                        self.conversation_manager.add_message("assistant", fix_response)
-                        
-                        # Recursively handle any new commands in the fix
-                        return self.handle_command_execution(fix_response)
-        
+
+        for _ in range(self.MAX_FIX_ROUNDS + 1):
+            if not commands:
+                break
+
+            failures = []
+
+            # First pass: run every command, collecting failures
+            for command in commands:
+                print(f"\n{Colors.OKBLUE}Found command to execute:{Colors.ENDC} {command}")
+
+                # Ask user if they want to execute
+                if (input("Execute this command? (y/n): ").strip() or 'n')[:1] in ('y', 'Y'):
+                    # Output is relayed live by the executor, no re-print needed
+                    success, stdout, stderr = self.command_executor.execute_command(command)
+
+                    if not success and stderr:
+                        failures.append((command, stderr))
+
+            if not failures:
+                break
+
+            # Second pass: one consolidated analysis request covers every
+            # failure, amortizing prompt processing over a single call
+            print(f"\n{Colors.WARNING}{len(failures)} command(s) failed. Asking AI for solutions...{Colors.ENDC}")
+
+            parts = ["The following commands failed:"]
+            for command, stderr in failures:
+                parts.append(f"\nCommand: {command}\nError:\n{stderr}")
+            parts.append("\nPlease analyze these errors and provide a solution or alternative approach.")
+            self.conversation_manager.add_message("user", "\n".join(parts))
+
+            fix_response = self.ollama_client.chat(self.conversation_manager.get_chat_messages())
+            if not fix_response:
+                break
+
+            print(f"\n{Colors.OKCYAN}AI Analysis:{Colors.ENDC}\n{fix_response}")
+            self.conversation_manager.add_message("assistant", fix_response)
+
+            # Loop again over any new commands suggested in the fix
+            commands = self.response_parser.extract_commands(fix_response)
+        else:
+            print(f"{Colors.WARNING}Stopping after {self.MAX_FIX_ROUNDS} fix attempts.{Colors.ENDC}")
+
         return response
     
     def run_interactive_session(self):
@@ -665,26 +1013,29 @@ These commands install Chocolatey (if needed) and then {package}."""
                     
                     if not user_input:
                         continue
-                    
-                    # Handle special commands
-                    if user_input.lower() in ['quit', 'exit', 'q']:
+
+                    # Handle special commands (input lowered once per turn)
+                    user_lower = user_input.lower()
+                    if user_lower in _EXIT_COMMANDS:
                         break
-                    elif user_input.lower() == 'help':
+                    elif user_lower == 'help':
                         self.show_help()
                         continue
-                    elif user_input.lower() == 'save':
+                    elif user_lower == 'save':
                         self.conversation_manager.save_history()
                         continue
-                    elif user_input.lower() == 'clear':
+                    elif user_lower == 'clear':
                         os.system('clear' if os.name == 'posix' else 'cls')
                         continue
-                    
+
                     # Process the request
-                    print(f"\n{Colors.OKCYAN}Assistant:{Colors.ENDC} Analyzing your request...")
-                    
-                    response = self.process_user_input(user_input)
-                    print(f"\n{Colors.OKCYAN}Assistant:{Colors.ENDC}\n{response}")
-                    
+                    print(f"\n{_ASSISTANT_PREFIX} Analyzing your request...")
+
+                    # process_user_input displays the response itself —
+                    # streamed responses are echoed token by token
+                    response = self.process_user_input(user_input, user_lower)
+
+
                     # Handle command execution if needed
                     self.handle_command_execution(response)
                     
@@ -697,10 +1048,13 @@ These commands install Chocolatey (if needed) and then {package}."""
         
         finally:
             print(f"\n{Colors.HEADER}Thank you for using IT Assistant!{Colors.ENDC}")
-            
+
             # Offer to save conversation
-            if input("Save conversation history? (y/n): ").lower().strip() == 'y':
+            if (input("Save conversation history? (y/n): ").strip() or 'n')[:1] in ('y', 'Y'):
                 self.conversation_manager.save_history()
+
+            self.ollama_client.release_model()
+            self.ollama_client.close()
     
     def show_help(self):
         """Display help information."""
@@ -735,14 +1089,26 @@ These commands install Chocolatey (if needed) and then {package}."""
 
 def setup_logging(config: Config):
     """Set up logging configuration."""
-    logging.basicConfig(
-        level=config.log_level,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(config.log_file),
-            logging.StreamHandler(sys.stdout)
-        ]
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    file_handler = logging.FileHandler(config.log_file)
+    file_handler.setFormatter(formatter)
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+
+    # Hand records off to a queue so logging in hot paths (command
+    # execution, chat error branches) never blocks on disk or terminal
+    # writes; a background listener thread owns the real handlers.
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(
+        log_queue, file_handler, stream_handler, respect_handler_level=True
     )
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.setLevel(config.log_level)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
 
 def main():
     """Main entry point."""
@@ -754,7 +1120,9 @@ def main():
                        default='INFO', help='Logging level')
     parser.add_argument('--no-confirm', action='store_true', help='Skip confirmation for privileged commands')
     parser.add_argument('--ai-timeout', type=int, default=180, help='AI response timeout in seconds')
-    
+    parser.add_argument('--stop-after-command', action='store_true',
+                       help='Stop AI generation once a complete command block has streamed')
+
     args = parser.parse_args()
     
     # Create configuration
@@ -765,6 +1133,7 @@ def main():
     config.log_level = getattr(logging, args.log_level)
     config.require_confirmation = not args.no_confirm
     config.ollama_timeout = args.ai_timeout
+    config.stop_after_command = args.stop_after_command
     
     # Setup logging
     setup_logging(config)